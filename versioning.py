@@ -4,10 +4,13 @@
 Management of software versions and global tags.
 """
 
-from distutils.version import LooseVersion
+import bisect
+import collections
+import copy
+import functools
 import json
 import os
-import shutil
+import re
 
 # recommended release
 _recommended_release = 'light-2411-aldebaran'
@@ -27,7 +30,69 @@ _supported_light_releases = [
 assert _supported_releases == sorted(_supported_releases)
 assert _supported_light_releases == sorted(_supported_light_releases)
 
+# set of supported light releases for O(1) membership tests
+_supported_light_releases_set = frozenset(_supported_light_releases)
 
+# supported (light) releases with the newest first, as returned by get_supported_releases
+_supported_releases_newest_first = tuple(reversed(_supported_releases))
+_supported_light_releases_newest_first = tuple(reversed(_supported_light_releases))
+
+
+# version part of a (pre)release name; a trailing suffix letter is ignored
+_release_version_re = re.compile(r'^(?:pre)?release-(\d+)-(\d+)-(\d+)')
+
+
+@functools.lru_cache(maxsize=256)
+def _basf2_version(release):
+    """
+    Parse a release name of the form release-NN-NN-NN into a comparable tuple of integers.
+
+    Returns None if the version part does not have the numeric NN-NN-NN form.
+    """
+    match = _release_version_re.match(release)
+    if match is None:
+        return None
+    return tuple(int(part) for part in match.groups())
+
+
+# parsed versions of the supported releases, precomputed once at import
+_supported_release_versions = tuple(_basf2_version(release) for release in _supported_releases)
+_latest_release_version = _supported_release_versions[-1]
+
+# all supported full and light releases as a shared immutable tuple
+_all_supported_releases = (*_supported_releases, *_supported_light_releases)
+
+# data_tags provides a mapping of supported release to the recommended data GT
+_data_tags = {_supported_releases[-1]: 'data_reprocessing_proc9'}
+
+# mc_tags provides a mapping of supported release to the recommended mc GT
+_mc_tags = {_supported_releases[-1]: 'mc_production_mc12'}
+
+# analysis_tags provides a mapping of supported release to the recommended analysis GT
+_analysis_tags = dict.fromkeys(_all_supported_releases, 'analysis_tools_light-2411-aldebaran')
+
+# combined (data GT, mc GT, analysis GT) triple per supported release,
+# derived from the individual tables once at import
+_tag_table = {
+    release: (_data_tags.get(release, None), _mc_tags.get(release, None), _analysis_tags.get(release, None))
+    for release in _all_supported_releases
+}
+
+# experiment numbers that identify run-independent MC
+_run_independent_mc_experiments = frozenset({0, 1002, 1003})
+
+# prefixes that identify a main GT among the base tags
+_main_tag_prefixes = ('main_', 'master_', 'release-', 'prerelease-')
+
+# common part of the jupyter kernel spec, specialized per release in create_jupyter_kernels
+_kernel_spec_template = {
+    "display_name": None,
+    "language": "python",
+    "argv": None,
+}
+
+
+@functools.lru_cache(maxsize=None)
 def supported_release(release=None):
     """
     Check whether the given release is supported.
@@ -41,33 +106,36 @@ def supported_release(release=None):
     """
 
     # default is hard-coded release given above
-    if release is None:
+    if release is None or release == _recommended_release:
         return _recommended_release
 
-    def basf2_version(release):
-        return LooseVersion('.'.join(release.split('-')[1:]))
+    # the latest full release and supported light releases are returned unchanged
+    if release == _supported_releases[-1]:
+        return release
+    if release in _supported_light_releases_set:
+        return release
 
-    # update to next supported release
-    if release.startswith('pre'):
+    # treat a prerelease like the release it precedes,
+    # truncating the trailing suffix letter of the prerelease name
+    if release.startswith('prerelease-'):
         release = release[3:19]
 
     if release == "release-":
         # Return the latest full release
         return _supported_releases[-1]
     elif release.startswith('release-'):
-        # it is fine if a release newer than the latest supported one is used
-        if basf2_version(release) >= basf2_version(_supported_releases[-1]):
-            return release
-        for supported in _supported_releases:
-            if basf2_version(release) < basf2_version(supported):
-                return supported
+        version = _basf2_version(release)
+        if version is not None:
+            # it is fine if a release newer than the latest supported one is used
+            if version >= _latest_release_version:
+                return release
+            # find the next supported release in the sorted list of precomputed versions
+            return _supported_releases[bisect.bisect_right(_supported_release_versions, version)]
+        # an unparsable version part falls through to the latest supported release
 
     # update to latest supported light release
     if release.startswith('light'):
-        if release in _supported_light_releases:
-            return release
-        else:
-            return _supported_light_releases[-1]
+        return _supported_light_releases[-1]
 
     # latest supported release
     return _supported_releases[-1]
@@ -77,9 +145,9 @@ def get_supported_releases(light=False):
     """Returns the list of recommended (light) releases"""
 
     if light:
-        return reversed(_supported_light_releases)
+        return _supported_light_releases_newest_first
     else:
-        return reversed(_supported_releases)
+        return _supported_releases_newest_first
 
 
 def get_recommended_training_release():
@@ -136,85 +204,125 @@ def recommended_global_tags_v2(release, base_tags, user_tags, metadata):
         release: a recommended release (optional)
     """
 
+    # convert the mutable arguments to hashable ones so that the result can be cached;
+    # only the metadata fields consumed by the computation enter the cache key since
+    # other fields may hold unhashable values like the parents list
+    if metadata:
+        first_metadata = metadata[0]
+        metadata_key = (
+            first_metadata['release'],
+            first_metadata['isMC'],
+            first_metadata['experimentLow'],
+            first_metadata['experimentHigh'],
+        )
+    else:
+        metadata_key = None if metadata is None else ()
+    result = _recommended_global_tags_cached(
+        release,
+        tuple(base_tags),
+        tuple(user_tags) if user_tags is not None else None,
+        metadata_key,
+    )
+
+    # the caller may modify the result, so return a copy with a fresh tags list
+    result = dict(result)
+    result['tags'] = list(result['tags'])
+    return result
+
+
+@functools.lru_cache(maxsize=1024)
+def _recommended_global_tags_cached(release, base_tags, user_tags, metadata):
+    """
+    Compute the recommended_global_tags_v2 result from hashable arguments.
+
+    The metadata is None, an empty tuple, or the (release, isMC,
+    experimentLow, experimentHigh) fields of the first input file.
+    """
+
     # gather information that we may want to use for the decision about the recommended GT:
     # existing GTs, release used to create the input data
-    existing_main_tags = [tag for tag in base_tags if tag.startswith('main_') or tag.startswith(
-        'master_') or tag.startswith('release-') or tag.startswith('prerelease-')]
-    existing_data_tags = [tag for tag in base_tags if tag.startswith('data_')]
-    existing_mc_tags = [tag for tag in base_tags if tag.startswith('mc_')]
-    existing_analysis_tags = [tag for tag in base_tags if tag.startswith('analysis_')]
-    data_release = metadata[0]['release'] if metadata else None
-
+    existing_main_tags = []
+    existing_data_tags = []
+    existing_mc_tags = []
+    existing_analysis_tags = []
+    for tag in base_tags:
+        if tag.startswith(_main_tag_prefixes):
+            existing_main_tags.append(tag)
+        elif tag.startswith('data_'):
+            existing_data_tags.append(tag)
+        elif tag.startswith('mc_'):
+            existing_mc_tags.append(tag)
+        elif tag.startswith('analysis_'):
+            existing_analysis_tags.append(tag)
     # if this is run-independent MC we don't want to show data tags (all other cases, we do)
     if metadata:
-        is_mc = bool(metadata[0]['isMC'])
-        experiments = [int(metadata[0]['experimentLow']), int(metadata[0]['experimentHigh'])]
-        is_run_independent_mc = experiments[0] == experiments[1] and experiments[0] in [0, 1002, 1003]
+        data_release, is_mc, experiment_low, experiment_high = metadata
+        is_mc = bool(is_mc)
+        experiment_low = int(experiment_low)
+        experiment_high = int(experiment_high)
+        is_run_independent_mc = experiment_low == experiment_high and experiment_low in _run_independent_mc_experiments
     else:
+        data_release = None
         is_run_independent_mc = False
 
     # now construct the recommendation
+    # the tags are accumulated in a deque so that prepending is O(1)
+    # and the message in a list that is joined once at the end
+    tags = collections.deque()
+    message_parts = []
     result = {'tags': [], 'message': ''}
 
     # recommended release
     recommended_release = supported_release(release)
     if (release.startswith('release') or release.startswith('light')) and recommended_release != release:
-        result['message'] += 'You are using %s, but we recommend to use %s.\n' % (release, recommended_release)
+        message_parts.append('You are using %s, but we recommend to use %s.\n' % (release, recommended_release))
         result['release'] = recommended_release
 
-    # tag to be used for (raw) data processing, depending on the release used for the processing
-    # data_tags provides a mapping of supported release to the recommended data GT
-    data_tags = {_supported_releases[-1]: 'data_reprocessing_proc9'}
-    data_tag = data_tags.get(recommended_release, None)
-
-    # tag to be used for run-dependent MC production, depending on the release used for the production
-    # mc_tags provides a mapping of supported release to the recommended mc GT
-    mc_tags = {_supported_releases[-1]: 'mc_production_mc12'}
-    mc_tag = mc_tags.get(recommended_release, None)
-
-    # tag to be used for analysis tools, depending on the release used for the analysis
-    # analysis_tags provides a mapping of supported release to the recommended analysis GT
-    _all_supported_releases = _supported_releases + _supported_light_releases
-    analysis_tags = dict(zip(_all_supported_releases, ['analysis_tools_light-2411-aldebaran'] * len(_all_supported_releases)))
-    analysis_tag = analysis_tags.get(recommended_release, None)
+    # tags to be used for (raw) data processing, run-dependent MC production,
+    # and analysis tools, depending on the recommended release
+    data_tag, mc_tag, analysis_tag = _tag_table.get(recommended_release, (None, None, None))
 
     # In case of B2BII we do not have metadata
-    if metadata == []:
-        result['tags'] = ['B2BII']
+    if metadata == ():
+        tags.append('B2BII')
 
     else:
         # If we have a main GT this means either we are generating events
         # or we read a file that was produced with it. So we keep it as last GT.
-        result['tags'] += existing_main_tags
+        tags.extend(existing_main_tags)
 
         # Always use online GT
-        result['tags'].insert(0, 'online')
+        tags.appendleft('online')
 
         # Prepend the data GT if the file is not run-independent MC
         if metadata is None or not is_run_independent_mc:
             if data_tag:
-                result['tags'].insert(0, data_tag)
+                tags.appendleft(data_tag)
             else:
-                result['message'] += 'WARNING: There is no recommended data global tag.'
+                message_parts.append('WARNING: There is no recommended data global tag.')
 
         # Prepend the MC GT if we generate events (no metadata)
         # or if we read a file that was produced with a MC GT
         if metadata is None or existing_mc_tags:
             if mc_tag:
-                result['tags'].insert(0, mc_tag)
+                tags.appendleft(mc_tag)
             else:
-                result['message'] += 'WARNING: There is no recommended mc global tag.'
+                message_parts.append('WARNING: There is no recommended mc global tag.')
 
     # Prepend the analysis GT
     if analysis_tag:
-        result['tags'].insert(0, analysis_tag)
+        tags.appendleft(analysis_tag)
     else:
-        result['message'] += 'WARNING: There is no recommended analysis global tag.'
+        message_parts.append('WARNING: There is no recommended analysis global tag.')
+
+    result['tags'] = list(tags)
 
     # What else do we want to tell the user?
-    if result['tags'] != base_tags:
-        result['message'] += 'The recommended tags differ from the base tags: %s' % ' '.join(base_tags) + '\n'
-        result['message'] += 'Use the default conditions configuration if you want to take the base tags.\n'
+    if result['tags'] != list(base_tags):
+        message_parts.append('The recommended tags differ from the base tags: %s' % ' '.join(base_tags) + '\n')
+        message_parts.append('Use the default conditions configuration if you want to take the base tags.\n')
+
+    result['message'] = ''.join(message_parts)
 
     return result
 
@@ -243,6 +351,22 @@ def performance_recommendation_global_tag(campaign='MC15'):
     return result
 
 
+# per-task settings for GT update requests: the GT to be used for uploads
+# (None if a new GT should be created by the client for each upload request)
+# and the assignee of the jira issue created for the request
+# master is kept only for backward compatibility
+_tasks = {
+    'master': {'upload': None, 'assignee': 'depietro'},
+    'main': {'upload': None, 'assignee': 'depietro'},
+    'validation': {'upload': None, 'assignee': 'jikumar'},
+    'online': {'upload': None, 'assignee': 'seokhee'},
+    'prompt': {'upload': None, 'assignee': 'mapr'},
+    'data': {'upload': None, 'assignee': 'mapr'},
+    'mc': {'upload': None, 'assignee': 'amartini'},
+    'analysis': {'upload': None, 'assignee': 'fmeier'},
+}
+
+
 def upload_global_tag(task):
     """
     Get the global tag that is supposed to be used for uploads for the given task.
@@ -254,22 +378,7 @@ def upload_global_tag(task):
       The name of the GT for uploads or None if a new GT should be created by the client for each upload request.
     """
 
-    if task == 'master':  # master is kept only for backward compatibility
-        return None
-    elif task == 'main':
-        return None
-    elif task == 'validation':
-        return None
-    elif task == 'online':
-        return None
-    elif task == 'prompt':
-        return None
-    elif task == 'data':
-        return None
-    elif task == 'mc':
-        return None
-    elif task == 'analysis':
-        return None
+    return _tasks.get(task, {}).get('upload')
 
 
 def jira_global_tag(task):
@@ -277,6 +386,14 @@ def jira_global_tag(task):
     See jira_global_tag_v2. This function is only provided for backward compatibility.
     """
 
+    # the returned dictionary may be modified by the caller, so hand out a copy of the cached result
+    return copy.deepcopy(_jira_global_tag_cached(task))
+
+
+@functools.lru_cache(maxsize=None)
+def _jira_global_tag_cached(task):
+    """Assemble the jira_global_tag result for the given task once per process."""
+
     result = jira_global_tag_v2(task)
     if result is None:
         return result
@@ -352,22 +469,11 @@ def jira_global_tag_v2(task):
       existing issue or a tuple for an adjusted description or None if no jira issue should be created.
     """
 
-    if task == 'master':  # master is kept only for backward compatibility
-        return {"assignee": {"name": "depietro"}}
-    elif task == 'main':
-        return {"assignee": {"name": "depietro"}}
-    elif task == 'validation':
-        return {"assignee": {"name": "jikumar"}}
-    elif task == 'online':
-        return {"assignee": {"name": "seokhee"}}
-    elif task == 'prompt':
-        return {"assignee": {"name": "mapr"}}
-    elif task == 'data':
-        return {"assignee": {"name": "mapr"}}
-    elif task == 'mc':
-        return {"assignee": {"name": "amartini"}}
-    elif task == 'analysis':
-        return {"assignee": {"name": "fmeier"}}
+    task_info = _tasks.get(task, None)
+    if task_info is None:
+        return None
+
+    return {"assignee": {"name": task_info['assignee']}}
 
 
 def create_jupyter_kernels(target_dir='~/.local/share/jupyter/kernels', top_dir='/cvmfs/belle.cern.ch'):
@@ -382,29 +488,46 @@ def create_jupyter_kernels(target_dir='~/.local/share/jupyter/kernels', top_dir=
     target_dir = os.path.expanduser(target_dir)
     top_dir = os.path.expanduser(top_dir)
     tools_dir = os.path.join(top_dir, "tools")
-    if not os.path.exists(target_dir):
-        os.makedirs(target_dir)
+    os.makedirs(target_dir, exist_ok=True)
 
-    for release in _supported_releases + _supported_light_releases:
+    # paths that are the same for all releases
+    b2execute = os.path.join(tools_dir, "b2execute")
+
+    # read the logos once instead of copying the same source files for each release
+    logos = []
+    logo64_path = os.path.join(tools_dir, "logo-64x64.png")
+    if os.path.exists(logo64_path):
+        for logo_name in ["logo-64x64.png", "logo-32x32.png"]:
+            with open(os.path.join(tools_dir, logo_name), "rb") as logofile:
+                logos.append((logo_name, logofile.read()))
+
+    for release in _all_supported_releases:
         name = release
         if name.startswith("release"):
             name = release.rsplit("-", 1)[0]  # remove patch version from name
         kernel_dir = os.path.join(target_dir, "belle2_" + name)
-        if not os.path.exists(kernel_dir):
-            os.mkdir(kernel_dir)
-        if os.path.exists(os.path.join(tools_dir, "logo-64x64.png")):
-            shutil.copy(os.path.join(tools_dir, "logo-64x64.png"), kernel_dir)
-            shutil.copy(os.path.join(tools_dir, "logo-32x32.png"), kernel_dir)
-        spec = {
-            "display_name": "Belle2 (" + release + ")",
-            "language": "python",
-            "argv": [
-                os.path.join(top_dir, "tools", "b2execute"), "-x", "python3",
-                release, "-m", "ipykernel_launcher",
-                "-f", "{connection_file}",
-            ]
-        }
-        with open(os.path.join(kernel_dir, "kernel.json"), "w") as specfile:
-            json.dump(spec, specfile, indent=4)
+        os.makedirs(kernel_dir, exist_ok=True)
+        for logo_name, logo_bytes in logos:
+            logo_path = os.path.join(kernel_dir, logo_name)
+            if os.path.exists(logo_path) and os.path.getsize(logo_path) == len(logo_bytes):
+                continue
+            with open(logo_path, "wb") as logofile:
+                logofile.write(logo_bytes)
+        spec = _kernel_spec_template.copy()
+        spec["display_name"] = "Belle2 (" + release + ")"
+        spec["argv"] = [
+            b2execute, "-x", "python3",
+            release, "-m", "ipykernel_launcher",
+            "-f", "{connection_file}",
+        ]
+        # skip the write and the message if the kernel file is already up to date
+        spec_path = os.path.join(kernel_dir, "kernel.json")
+        spec_bytes = json.dumps(spec).encode()
+        if os.path.exists(spec_path):
+            with open(spec_path, "rb") as specfile:
+                if specfile.read() == spec_bytes:
+                    continue
+        with open(spec_path, "wb") as specfile:
+            specfile.write(spec_bytes)
 
         print("Created kernel for " + release)